@@ -1,74 +1,168 @@
-import argparse,os,json
+import argparse,os,hashlib,mmap,pickle,tempfile
+from concurrent.futures import ThreadPoolExecutor
+import orjson
 import seaborn as sns
 import matplotlib.pyplot as plt
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 from matplotlib.figure import figaspect
-import time
+from dateutil import tz
 parser = argparse.ArgumentParser()
 parser.add_argument("-i","--input",required=True,type=str)
 parser.add_argument("-o","--output",required=True,type=str)
 parser.add_argument("--interval",required=True,type=int)
+parser.add_argument("--verbose",action="store_true")
 args = parser.parse_args()
-
+# bump when preprocess() output changes
+CACHE_VERSION = 2
+
+
+
+def load_snapshot(json_path):
+    # parse from the mapping, no bytes copy
+    with open(json_path,"rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if hasattr(mm, 'madvise'):
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+        with memoryview(mm) as buf:
+            jsondata = orjson.loads(buf)
+    jsondata.pop('numChildNodes', "123")
+    return jsondata
+
+
+def write_atomically(path, write, mode=None):
+    # never leave a truncated cache behind
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        if mode is None:
+            # mkstemp ignores the umask
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def preprocess(json_stats):
+    jsonfiles = list(json_stats)
+    cache_path = os.path.join(args.input, ".cache.parquet")
+    sig = {jsonfile: st.st_mtime_ns for jsonfile, st in json_stats.items()}
+    data = None
+    if os.path.exists(cache_path):
+        try:
+            table = pq.read_table(cache_path)
+            cached_sig = (table.schema.metadata or {}).get(b'snapshot_sig')
+            if cached_sig is not None and orjson.loads(cached_sig) == [CACHE_VERSION, sig]:
+                data = table.to_pandas().transpose()
+        except (OSError, ValueError, pa.ArrowException):
+            pass
+
+    if data is None:
+        # snapshot names are local wall-clock times
+        timestamps = pd.to_datetime([jsonfile.split('.')[0] for jsonfile in jsonfiles], format="%Y%m%d%H%M%S")
+        timestamps = timestamps.tz_localize(tz.tzlocal(), ambiguous=np.zeros(len(timestamps), dtype=bool), nonexistent='shift_forward')
+        timestamps = timestamps.as_unit('s').astype('int64')
+        with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as executor:
+            jsondatas = list(executor.map(load_snapshot, [os.path.join(args.input,jsonfile) for jsonfile in jsonfiles]))
+        # protobuf's JSON output omits zero-valued fields
+        metrics = list(dict.fromkeys(metric for jsondata in jsondatas for metric in jsondata))
+        fuzz_data = np.array([[jsondata.get(metric, 0) for metric in metrics] for jsondata in jsondatas], dtype=np.float64)
+        # parquet wants string column names
+        snapshots = pd.DataFrame(fuzz_data, index=timestamps, columns=metrics)
+        table = pa.Table.from_pandas(snapshots)
+        table = table.replace_schema_metadata({**table.schema.metadata, b'snapshot_sig': orjson.dumps([CACHE_VERSION, sig])})
+        try:
+            write_atomically(cache_path, lambda f: pq.write_table(table, f))
+        except OSError:
+            pass
+        data = snapshots.transpose()
+
+
+    data = data.sort_index(axis=1)
+    start_time = min(data.keys()) - args.interval
+    data = data.iloc[:, :-1]
+    data = data.set_axis((data.columns.astype('int64') - start_time) // 60, axis=1)
+    total_samples = data.loc['totalSamples'].to_numpy(dtype=np.int64)
+    # .loc can't add a row to a frame without columns
+    data = pd.concat([data, pd.DataFrame([np.diff(total_samples, prepend=0) / 60], index=['execsPerSec'], columns=data.columns)])
+
+    nautilus_coverage_df = pd.read_csv("./nautilus_coverage.txt", engine='pyarrow', usecols=['mtime','edges'], dtype={'mtime':'int64','edges':'int64'})
+    # nautilus_coverage_df
+    start_time = min(nautilus_coverage_df['mtime'])
+    nautilus_coverage_df['mtime'] = (nautilus_coverage_df['mtime'].to_numpy() - start_time) / 60
+
+
+    afl_coverage_df = pd.read_csv("./afl_coverage.txt", engine='pyarrow', usecols=['mtime','edges'], dtype={'mtime':'int64','edges':'int64'})
+    # nautilus_coverage_df
+    mtime = afl_coverage_df['mtime'].to_numpy()
+    mtime = (mtime - mtime.min()) / 60
+    mask = mtime <= 693
+    afl_coverage_df = pd.DataFrame({'mtime': mtime[mask], 'edges': afl_coverage_df['edges'].to_numpy()[mask]})
+
+    nautilus_correctness_df = pd.read_csv("./nautilus_correctness.txt", engine='pyarrow', usecols=['success_count','fail_count'], dtype={'success_count':'int64','fail_count':'int64'})
+    success_count, fail_count = nautilus_correctness_df['success_count'].to_numpy(), nautilus_correctness_df['fail_count'].to_numpy()
+    nautilus_correctness_df['correctness'] = success_count / (success_count + fail_count)
+
+    nautilus_df = pd.read_csv("./correctness.txt", engine='pyarrow', usecols=['success_count','fail_count'], dtype={'success_count':'int64','fail_count':'int64'})
+    success_count, fail_count = nautilus_df['success_count'].to_numpy(), nautilus_df['fail_count'].to_numpy()
+    sample_counts = success_count + fail_count
+    nautilus_df['correctness'] = success_count / sample_counts
+    nautilus_df['execsPerSec'] = np.diff(sample_counts, prepend=0)
+    return data, nautilus_coverage_df, afl_coverage_df, nautilus_correctness_df, nautilus_df
 
 
 assert(os.path.isdir(args.input))
 assert(os.path.isdir(args.output))
-fuzz_data = {}
-for jsonfile in os.listdir(args.input):
-    if jsonfile.endswith('.json'):
-        json_path = os.path.join(args.input,jsonfile)
-        with open(json_path,"r") as f:
-            jsondata = json.load(f)
-            jsondata.pop('numChildNodes', "123")
-            # fuzz_data[jsonfile.split('.')[0]] = list(jsondata.values())
-            fuzz_data[int(time.mktime(time.strptime(jsonfile.split('.')[0], "%Y%m%d%H%M%S")))] = jsondata
-
-
-data = pd.DataFrame(data=fuzz_data)
-data = data.sort_index(axis=1)
-start_time = min(data.keys()) - args.interval
-data = data.set_axis(data.keys().map(lambda x: (x - start_time) // 60), axis=1)
-data.drop(data.columns[[-1,]], axis=1, inplace=True)
-last_sample_count = 0
-execsPerSec = []
-for col in data.columns:
-    execsPerSec.append( (int(data[col]["totalSamples"]) - last_sample_count) / 60 )
-    last_sample_count = int(data[col]["totalSamples"]) 
-data.loc['execsPerSec'] = execsPerSec
-print(data)
-
-
-nautilus_coverage_df = pd.read_csv("./nautilus_coverage.txt")
-# nautilus_coverage_df
-start_time = min(nautilus_coverage_df['mtime'])
-nautilus_coverage_df['mtime'] = nautilus_coverage_df['mtime'].map(lambda x: (x - start_time) / 60)
-
-
-afl_coverage_df = pd.read_csv("./afl_coverage.txt")
-# nautilus_coverage_df
-start_time = min(afl_coverage_df['mtime'])
-afl_coverage_df['mtime'] = afl_coverage_df['mtime'].map(lambda x: (x - start_time) / 60)
-afl_coverage_df = afl_coverage_df[afl_coverage_df['mtime'] <= 693]
-
+jsonfiles = [f for f in os.listdir(args.input) if f.endswith('.json')]
+json_stats = {jsonfile: os.stat(os.path.join(args.input,jsonfile)) for jsonfile in jsonfiles}
+csv_paths = ["./nautilus_coverage.txt", "./afl_coverage.txt", "./nautilus_correctness.txt", "./correctness.txt"]
+input_stats = sorted([(os.path.join(args.input,f), st.st_mtime_ns, st.st_size) for f, st in json_stats.items()] +
+                     [(p, os.stat(p).st_mtime_ns, os.stat(p).st_size) for p in csv_paths])
+cache_key = (CACHE_VERSION, pd.__version__, np.__version__, args.interval, input_stats)
+# one pickle per input, in a private dir since unpickling runs code
+cache_dir = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "fuzzilli-lua")
+input_id = hashlib.sha1(repr((os.path.abspath(args.input), os.getcwd())).encode()).hexdigest()
+pickle_path = os.path.join(cache_dir, f"plot_{input_id}.pkl")
+frames = None
+if os.path.exists(pickle_path):
+    try:
+        with open(pickle_path, "rb") as f:
+            cached_key, cached_frames = pickle.load(f)
+        if cached_key == cache_key:
+            data, nautilus_coverage_df, afl_coverage_df, nautilus_correctness_df, nautilus_df = frames = cached_frames
+    except Exception:
+        frames = None
+if frames is None:
+    frames = preprocess(json_stats)
+    data, nautilus_coverage_df, afl_coverage_df, nautilus_correctness_df, nautilus_df = frames
+    try:
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        write_atomically(pickle_path, lambda f: pickle.dump((cache_key, frames), f), mode=0o600)
+    except OSError:
+        pass
+if args.verbose:
+    print(data)
+
+
+
+plt.rcParams.update({'axes.titlesize': 16, 'axes.labelsize': 16, 'xtick.labelsize': 16, 'ytick.labelsize': 16})
 w, h = figaspect(0.618)  # golden ratio
 fig, ax = plt.subplots(figsize=(w, h))
-for item in ([ax.title, ax.xaxis.label, ax.yaxis.label]):
-    item.set_fontsize(16)
-for item in (ax.get_xticklabels()):
-    item.set_fontsize(16)
-    item.set_rotation(45)
-for item in (ax.get_yticklabels()):
-    item.set_fontsize(16)
+ax.tick_params(axis='x', labelrotation=45)
 
 # print(nautilus_coverage_df['edges'])
-ax.plot([0] + list(nautilus_coverage_df['mtime'].values), [0] + list(nautilus_coverage_df['edges'].values), color="g", linewidth=2, solid_capstyle="butt", zorder=4, ms=6, label="Nautilus")
+ax.plot(np.concatenate(([0], nautilus_coverage_df['mtime'].to_numpy())), np.concatenate(([0], nautilus_coverage_df['edges'].to_numpy())), color="g", linewidth=2, solid_capstyle="butt", zorder=4, ms=6, rasterized=True, label="Nautilus")
 
-ax.plot([0] + list(afl_coverage_df['mtime'].values), [0] + list(afl_coverage_df['edges'].values), color="y", linewidth=2, solid_capstyle="butt", zorder=4, ms=6, label="AFL")
+ax.plot(np.concatenate(([0], afl_coverage_df['mtime'].to_numpy())), np.concatenate(([0], afl_coverage_df['edges'].to_numpy())), color="y", linewidth=2, solid_capstyle="butt", zorder=4, ms=6, rasterized=True, label="AFL")
 # ax.set_yticks(np.linspace(0,3000,100))
 # print()
-ax.plot([0] + list(data.keys().values), [0] + list(map(lambda x: int(x), list(data.loc['foundEdges',:].values))), color="r", linewidth=2, solid_capstyle="butt", zorder=4, ms=6,label="MAGGOT")
+ax.plot(np.concatenate(([0], data.columns.to_numpy())), np.concatenate(([0], data.loc['foundEdges'].to_numpy(dtype=np.int64))), color="r", linewidth=2, solid_capstyle="butt", zorder=4, ms=6, rasterized=True, label="MAGGOT")
 
 ax.set_xlim(xmin=0)
 ax.set_ylim(ymin=0)
@@ -77,71 +171,46 @@ plt.legend()    # 图例
 plt.tight_layout()
 # plt.show()
 plt.savefig(args.output+'/'+"coverage"+'.png')
-plt.clf()
-plt.close(fig)
+ax.clear()
+ax.tick_params(axis='x', labelrotation=0)
 
 
 
-nautilus_correctness_df = pd.read_csv("./nautilus_correctness.txt")
-nautilus_correctness_df['correctness'] = nautilus_correctness_df.apply(lambda x: x['success_count'] / (x['success_count'] + x['fail_count']),axis = 1)
 
 
 
-print(nautilus_correctness_df)
+if args.verbose:
+    print(nautilus_correctness_df)
 # box = sns.boxplot(ax=ax,y=data.loc['correctnessRate',:], orient="v", fliersize=0,
 #                     dodge=False)
 # ax.set_xticks
 
 # ax.set_xticklabels(['Fuzzilli_Lua', "Nautilus"])
-fig, ax = plt.subplots(figsize=(w, h))
-for item in ([ax.title, ax.xaxis.label, ax.yaxis.label]):
-    item.set_fontsize(16)
-for item in (ax.get_xticklabels()):
-    item.set_fontsize(16)
-    # item.set_rotation(45)
-for item in (ax.get_yticklabels()):
-    item.set_fontsize(16)
-print(pd.concat([data.transpose()['correctnessRate'],nautilus_correctness_df['correctness']],axis=1))
-box = sns.violinplot(ax=ax,data=pd.concat([data.transpose()['correctnessRate'],nautilus_correctness_df['correctness']],axis=1), orient="v", fliersize=0,
+correctness_df = pd.concat([data.loc['correctnessRate'],nautilus_correctness_df['correctness']],axis=1)
+if args.verbose:
+    print(correctness_df)
+box = sns.violinplot(ax=ax,data=correctness_df, orient="v", fliersize=0,
                     dodge=False,width=0.4,palette="YlGnBu")
 plt.setp(ax, xticks=[0,1],xticklabels=['MAGGOT', 'Nautilus'])
 plt.ylabel("Correctness(%)")
-
+plt.tight_layout()
 plt.savefig(args.output+'/'+"Correctness"+'.png')
 # plt.show()
-plt.clf()
-plt.close(fig)
+ax.clear()
 
 
 
-nautilus_df = pd.read_csv("./correctness.txt")
-nautilus_df['correctness'] = nautilus_df.apply(lambda x: x['success_count'] / (x['success_count'] + x['fail_count']),axis = 1)
-last_sample_count = 0
-execsPerSec = []
-for index, row in nautilus_df.iterrows():
-    execsPerSec.append( (row['success_count'] + row['fail_count'] - last_sample_count))
-    if (row['success_count'] + row['fail_count'] - last_sample_count) < 0:
-        print(index)
+for index in nautilus_df.index[nautilus_df['execsPerSec'] < 0]:
+    print(index)
 
-    last_sample_count = row['success_count'] + row['fail_count']
-    
-nautilus_df['execsPerSec'] = execsPerSec
 
-fig, ax = plt.subplots(figsize=(w, h))
-for item in ([ax.title, ax.xaxis.label, ax.yaxis.label]):
-    item.set_fontsize(16)
-for item in (ax.get_xticklabels()):
-    item.set_fontsize(16)
-    # item.set_rotation(45)
-for item in (ax.get_yticklabels()):
-    item.set_fontsize(16)
-
-print(pd.concat([data.transpose()['execsPerSec'],nautilus_df['execsPerSec']],axis=1,ignore_index=True))
-box = sns.boxplot(ax=ax,data=pd.concat([data.transpose()['execsPerSec'],nautilus_df['execsPerSec']],axis=1,ignore_index=True), orient="v", fliersize=2,
+execution_speed_df = pd.concat([data.loc['execsPerSec'],nautilus_df['execsPerSec']],axis=1,ignore_index=True)
+if args.verbose:
+    print(execution_speed_df)
+box = sns.boxplot(ax=ax,data=execution_speed_df, orient="v", fliersize=2,
                     dodge=False,width=0.4,palette="YlGnBu",showmeans=True,  linewidth=1,            meanprops={'marker':'o','markerfacecolor':'white', 'markeredgecolor':'black','markersize':'8'})
 plt.setp(ax, xticks=[0,1],xticklabels=['MAGGOT', 'Nautilus'])
 plt.ylabel("Execution Speed(execs/s)")
-
+plt.tight_layout()
 plt.savefig(args.output+'/'+"execution_speed"+'.png')
-plt.clf()
 plt.close(fig)